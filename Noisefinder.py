@@ -5,128 +5,181 @@
 #!/usr/bin/env python
 
 from __future__ import division
+from TargetIndex import TargetIndex
 import argparse, csv, sys, re
 csv.field_size_limit(sys.maxsize)
 
+class NoiseScanner(object):
+    # scans pileup rows for noisy regions. scan() yields regions as tuples of strings: (<seq_id>, <start>, <end>, <length>, <SNV_density>)
+    # low depth regions are yielded with "xxx" in place of SNV density when addlc is given. Global metrics accumulate on the instance
+    # if targets (a TargetIndex) is given, off-target rows are skipped unparsed and close any open region or low depth region, so regions never span target boundaries
+
+    def __init__(self, mindep=5, minlen=300, regnf=0.005, basef=0.2, addlc=None, targets=None):
+        self.mindep = mindep
+        self.minlen = minlen
+        self.regnf = regnf
+        self.basef = basef
+        self.addlc = addlc
+        self.targets = targets
+        # global metrics
+        self.scontigs = 0
+        self.regions = 0
+        self.offtarget = 0
+
+    def scan(self, rows):
+        # regional metrics
+        snvs = 0
+        bplen = 0
+        contig = ''
+        start = '' 
+        end = ''
+        rpg = 0 # stands for "regions per contig" that satisfy criteria 
+        # set switch, parse rows (switch is on "True" when a candidate region is being counted)
+        switch = False
+        incLDR = False # include low depth regions. Set to true when addlc given an integer argument
+        if self.addlc:
+            incLDR = True
+            lenLDR = 0
+            sttLDR = 0
+            endLDR = ''
+            ctgLDR = ''
+        pat = re.compile('[atcgn]', re.I)
+        targets = self.targets
+        for row in rows:
+            if targets is not None and not targets.contains(row[0], row[1]): # contigs without targets are rejected before any conversion of the row
+                self.offtarget += 1
+                if switch == True: # leaving a target signals end of region and yields results if all criteria satisfied. Metrics reset
+                    if bplen > self.minlen and snvs/bplen >= self.regnf:
+                        self.regions += 1
+                        end = int(start) + bplen
+                        rpg += 1
+                        if rpg == 1:
+                            self.scontigs += 1
+                        yield (contig, start, str(end), str(bplen), str(round(snvs/bplen, 3)))
+                    bplen = 0
+                    snvs = 0
+                    switch = False
+                elif incLDR and lenLDR > 0: # yield current LDR stats on leaving a target
+                    endLDR = int(sttLDR) + lenLDR
+                    if lenLDR >= self.addlc:
+                        yield (ctgLDR, sttLDR, str(endLDR), str(lenLDR), 'xxx')
+                if incLDR: # next low depth row on a target starts a new LDR
+                    lenLDR = 0
+                    ctgLDR = ''
+                continue
+            if int(row[3]) < self.mindep and switch == False: # ignore rows if mindep below cutoff and switch is off
+                if incLDR:
+                    if row[0] == ctgLDR: # count rows if in low depth region and --addlc option is on
+                        lenLDR += 1
+                    else: # yield current LDR stats if seqID (row 0) changes and reinitialise LDR stats for new seqID
+                        endLDR = int(sttLDR) + lenLDR
+                        if lenLDR >= self.addlc:
+                            yield (ctgLDR, sttLDR, str(endLDR), str(lenLDR), 'xxx')
+                        ctgLDR = row[0]
+                        sttLDR = row[1]
+                        lenLDR = 1
+                continue
+            elif int(row[3]) >= self.mindep and switch == False: # initialise new candidate region if mindep rises above cutoff and switch previously off
+                bplen = 1
+                switch = True
+                start = row[1]
+                snvs = 0
+                if row[0] != contig:
+                    contig = row[0]
+                    rpg = 0
+                if len(pat.findall(row[4]))/int(row[3]) >= self.basef:
+                    snvs += 1
+                if incLDR: # yield current LDR stats if --addlc is on
+                    endLDR = int(sttLDR) + lenLDR
+                    if lenLDR >= self.addlc:
+                        yield (ctgLDR, sttLDR, str(endLDR), str(lenLDR), 'xxx')
+            elif int(row[3]) >= self.mindep and row[0] == contig and switch == True: # while switch is on and mindep stays above cutoff, rows will be SNV tested
+                bplen += 1
+                if len(pat.findall(row[4]))/int(row[3]) >= self.basef:
+                    snvs += 1
+            elif int(row[3]) < self.mindep and row[0] == contig and switch == True: # if mindep drops below cutoff while switch is on, signals end of region and yields results if all criteria satisfied. Metrics reset
+                if bplen > self.minlen and snvs/bplen >= self.regnf:
+                    self.regions += 1
+                    end = row[1]
+                    rpg += 1
+                    if rpg == 1:
+                        self.scontigs += 1
+                    yield (contig, start, end, str(bplen), str(round(snvs/bplen, 3)))
+                bplen = 0
+                snvs = 0
+                switch = False
+                if incLDR: # reinitialise LDR stats for new region if --addlc is on
+                    ctgLDR = row[0]
+                    sttLDR = row[1]
+                    lenLDR = 1
+            elif str(row[0]) != contig and switch == True: # if contig id changes while switch is on, signals end of region and yields results if all criteria satisfied. Metrics reset
+                if bplen > self.minlen and snvs/bplen >= self.regnf:
+                    end = int(start) + bplen
+                    self.regions += 1
+                    rpg += 1
+                    if rpg == 1:
+                        self.scontigs += 1
+                    rpg = 0
+                    yield (contig, start, str(end), str(bplen), str(round(snvs/bplen, 3)))
+                    contig = row[0]
+                if int(row[3]) >= self.mindep: # if mindep of first base in new contig satisfies cutoff, new candidate region initialised
+                    start = row[1]
+                    bplen = 1
+                    if len(pat.findall(row[4]))/int(row[3]) >= self.basef:
+                        snvs = 1
+                else: # metrics reset if mindep below cutoff
+                    bplen = 0
+                    snvs = 0
+                    switch = False
+                    if incLDR: # reinitialise LDR stats for new region if --addlc is on
+                        ctgLDR = row[0]
+                        sttLDR = row[1]
+                        lenLDR = 1
+        if switch == True: # yields final region results if switch still on when end of rows reached and all criteria satisfied
+            if bplen > self.minlen and snvs/bplen >= self.regnf:
+                self.regions += 1
+                end = int(start) + bplen
+                rpg += 1
+                if rpg == 1:
+                    self.scontigs += 1
+                yield (contig, start, str(end), str(bplen), str(round(snvs/bplen, 3)))
+        elif incLDR: # yields final LDR results if switch off when end of rows reached and --addlc is on
+            endLDR = int(sttLDR) + lenLDR
+            if lenLDR >= self.addlc:
+                yield (ctgLDR, sttLDR, str(endLDR), str(lenLDR), 'xxx')
+
 def main():
 
     # Parse arguments.
     parser = argparse.ArgumentParser(description='Regions rich in mismatches/poor coverage after read alignment can often signify misalignment or mixed alignment due to allelism, polyploidy, or large deletions. Given a pileup file, noisefinder reports regions containing a density of SNVs above a user defined threshold over a given min length and min read depth (prints to STDOUT).')
     parser.add_argument('-i', '--infile', nargs='?', type=argparse.FileType('r'), default=sys.stdin, help='indicate input pileup. Leave out option if piping from STDIN. Best if pileups generated with -a/-aa option (samtools > v1.4)')
     parser.add_argument('-d', '--mindep', help='set min depth. Only bases with read coverage equal to or above this number are considered for SNV calling (default=5)', default=5, type=int, required=False)
-    parser.add_argument('-l', '--minlen', help='set min length. Only compute SNV frequency for regions above this length (default=300)', default=300, type=int, required=False)
+    parser.add_argument('-l', '--minlen', help='set min length. Only compute SNV frequency for regions above this length (default=300, or 50 with -t/--targets as regions end at target boundaries)', type=int, required=False)
     parser.add_argument('-c', '--regnf', help='set min density (frequency over region) of SNVs. Only report regions, contigs having a SNV density higher than or equal to this (default=0.005 aka 1/200 bases)', default=0.005, type=float, required=False)
     parser.add_argument('-b', '--basef', help='set min frequency of mismatch at base to call a SNV (default=0.2)', default=0.2, type=float, required=False)
-    parser.add_argument('-a', '--addlc', help='indicate min length of regions below depth cutoff to include in final output (these are not SNV counted but marked with "xxx" in last field)', type=int, required=False)
+    parser.add_argument('-t', '--targets', type=argparse.FileType('r'), help='provide a BED file of target regions (eg. exome capture baits). Off-target positions are skipped unparsed and regions are not extended across target boundaries. The same BED can be given to samtools mpileup -l to restrict the pileup upstream.', required=False)
+    parser.add_argument('-a', '--addlc', help='indicate min length of regions below depth cutoff to include in final output (these are not SNV counted but marked with "xxx" in last field). Min 200, or 50 with -t/--targets', type=int, required=False)
     args = parser.parse_args()
 
+    # regions end at target boundaries, so shorter lengths are allowed with targets (merged exome targets are mostly shorter than 300)
+    if args.minlen is None:
+        args.minlen = 50 if args.targets else 300
+    minLDR = 50 if args.targets else 200
+    if args.addlc and args.addlc < minLDR:
+        sys.exit("option --addlc does not accept lengths less than " + str(minLDR) + ".")
+
     # open pileup
     pileIn = csv.reader(args.infile, delimiter = '\t', quoting=csv.QUOTE_NONE)
     print('#parsing pileup...\n#\n#<seq_id>\t<start>\t<end>\t<length>\t<SNV_density>')
-    # global metrics
-    scontigs = 0
-    regions = 0
-    # regional metrics
-    snvs = 0
-    bplen = 0
-    contig = ''
-    start = '' 
-    end = ''
-    rpg = 0 # stands for "regions per contig" that satisfy criteria 
-    # set switch, parse rows (switch is on "True" when a candidate region is being counted)
-    switch = False
-    incLDR = False # include low depth regions. Set to true when -a given an integer argument
-    if args.addlc:
-        if args.addlc < 200:
-            sys.exit("option --addlc does not accept lengths less than 200.")
-        incLDR = True
-        lenLDR = 0
-        sttLDR = 0
-        endLDR = ''
-        ctgLDR = ''
-    pat = re.compile('[atcgn]', re.I)
-    for row in pileIn:
-        if int(row[3]) < args.mindep and switch == False: # ignore rows if mindep below cutoff and switch is off
-            if incLDR:
-                if row[0] == ctgLDR: # count rows if in low depth region and --addlc option is on
-                    lenLDR += 1
-                else: # print current LDR stats if seqID (row 0) changes and reinitialise LDR stats for new seqID
-                    endLDR = int(sttLDR) + lenLDR
-                    if lenLDR >= args.addlc:
-                        print(ctgLDR + '\t' + sttLDR + '\t' + str(endLDR) + '\t' + str(lenLDR) + '\txxx')
-                    ctgLDR = row[0]
-                    sttLDR = row[1]
-                    lenLDR = 1
-            continue
-        elif int(row[3]) >= args.mindep and switch == False: # initialise new candidate region if mindep rises above cutoff and switch previously off
-            bplen = 1
-            switch = True
-            start = row[1]
-            snvs = 0
-            if row[0] != contig:
-                contig = row[0]
-                rpg = 0
-            if len(pat.findall(row[4]))/int(row[3]) >= args.basef:
-                snvs += 1
-            if incLDR: # print current LDR stats if --addlc is on
-                endLDR = int(sttLDR) + lenLDR
-                if lenLDR >= args.addlc:
-                    print(ctgLDR + '\t' + sttLDR + '\t' + str(endLDR) + '\t' + str(lenLDR) + '\txxx')
-        elif int(row[3]) >= args.mindep and row[0] == contig and switch == True: # while switch is on and mindep stays above cutoff, rows will be SNV tested
-            bplen += 1
-            if len(pat.findall(row[4]))/int(row[3]) >= args.basef:
-                snvs += 1
-        elif int(row[3]) < args.mindep and row[0] == contig and switch == True: # if mindep drops below cutoff while switch is on, signals end of region and prints results if all criteria satisfied. Metrics reset
-            if bplen > args.minlen and snvs/bplen >= args.regnf:
-                regions += 1
-                end = row[1]
-                rpg += 1
-                if rpg == 1:
-                    scontigs += 1
-                print(contig + '\t' + start + '\t' + end + '\t' + str(bplen) + '\t' + str(round(snvs/bplen, 3)))
-            bplen = 0
-            snvs = 0
-            switch = False
-            if incLDR: # reinitialise LDR stats for new region if --addlc is on
-                ctgLDR = row[0]
-                sttLDR = row[1]
-                lenLDR = 1
-        elif str(row[0]) != contig and switch == True: # if contig id changes while switch is on, signals end of region and prints results if all criteria satisfied. Metrics reset
-            if bplen > args.minlen and snvs/bplen >= args.regnf:
-                end = int(start) + bplen
-                regions += 1
-                rpg += 1
-                if rpg == 1:
-                    scontigs += 1
-                rpg = 0
-                print(contig + '\t' + start + '\t' + str(end) + '\t' + str(bplen) + '\t' + str(round(snvs/bplen, 3)))
-                contig = row[0]
-            if int(row[3]) >= args.mindep: # if mindep of first base in new contig satisfies cutoff, new candidate region initialised
-                start = row[1]
-                bplen = 1
-                if len(pat.findall(row[4]))/int(row[3]) >= args.basef:
-                    snvs = 1
-            else: # metrics reset if mindep below cutoff
-                bplen = 0
-                snvs = 0
-                switch = False
-                if incLDR: # reinitialise LDR stats for new region if --addlc is on
-                    ctgLDR = row[0]
-                    sttLDR = row[1]
-                    lenLDR = 1
-    if switch == True: # prints final region results if switch still on when end of file reached and all criteria satisfied
-        if bplen > args.minlen and snvs/bplen >= args.regnf:
-            regions += 1
-            end = int(start) + bplen
-            rpg += 1
-            if rpg == 1:
-                scontigs += 1
-            print(contig + '\t' + start + '\t' + str(end) + '\t' + str(bplen) + '\t' + str(round(snvs/bplen, 3)))
-    elif incLDR: # prints final LDR results if switch off when end of file reached and --addlc is on
-        endLDR = int(sttLDR) + lenLDR
-        if lenLDR >= args.addlc:
-            print(ctgLDR + '\t' + sttLDR + '\t' + str(endLDR) + '\t' + str(lenLDR) + '\txxx')
-    print('########\n#in ' + str(scontigs) + ' contigs, found ' + str(regions) + ' regions of length ' + str(args.minlen) + ' or more containing a SNV density of at least ' + str(args.regnf) + ' with a min frequency of ' + str(args.basef) + ' to call as SNV.')
+    targets = None
+    if args.targets:
+        targets = TargetIndex(csv.reader(args.targets, delimiter = '\t', quoting=csv.QUOTE_NONE))
+    scanner = NoiseScanner(args.mindep, args.minlen, args.regnf, args.basef, args.addlc, targets)
+    for region in scanner.scan(pileIn):
+        print('\t'.join(region))
+    print('########\n#in ' + str(scanner.scontigs) + ' contigs, found ' + str(scanner.regions) + ' regions of length ' + str(args.minlen) + ' or more containing a SNV density of at least ' + str(args.regnf) + ' with a min frequency of ' + str(args.basef) + ' to call as SNV.')
+    if targets is not None:
+        print('#targets: ' + args.targets.name + ' (' + str(targets.length()) + ' bp in ' + str(len(targets)) + ' contigs), skipped ' + str(scanner.offtarget) + ' off-target positions.')
 
 if __name__ == '__main__':
     main()
@@ -6,9 +6,161 @@
 
 from __future__ import division
 from numpy.random import randint
+from TargetIndex import TargetIndex
 import argparse, sys, re, csv
 csv.field_size_limit(sys.maxsize)
 
+def load_blacklist(rows):
+    # retrieve contig zones from noisefinder rows (a csv reader of a noise.log or Noisefinder.NoiseScanner records)
+    ctgdict = {}
+    for row in rows:
+        try:
+            if row[0] in ctgdict:
+                ctgdict.setdefault(row[0], []).append((int(row[1]),int(row[2])))
+            else:
+                ctgdict[row[0]]=[(int(row[1]),int(row[2]))]
+        except (IndexError, ValueError):
+            continue
+    #generates something like: {'contig_1':[(210,510),(1215,3211)],'contig_2':[(123,456),(789,1112),...} 
+    return ctgdict
+
+class SNPcaller(object):
+    # calls SNPs and indels from pileup rows. call() yields records as tuples of strings in snp.log field order: (<seqid>, <position>, <polymorphic-type>, <frequency>)
+    # depth and SNP tallies accumulate on the instance so they can be reported once the rows are exhausted
+    # if targets (a TargetIndex) is given, only on-target rows are called and tallied on the instance. Off-target rows are skipped unparsed and only counted,
+    # unless offstats is True, in which case they are tallied (but not yielded) on a second caller at self.off
+
+    def __init__(self, mindep=10, minfrq=0.2, idfrq=0.8, blacklist=None, targets=None, offstats=False):
+        self.mindep = mindep
+        self.minfrq = minfrq
+        self.idfrq = idfrq
+        self.blacklist = blacklist or {} # as returned by load_blacklist()
+        self.targets = targets
+        self.off = None
+        if targets is not None and offstats:
+            self.off = SNPcaller(mindep, minfrq, idfrq, blacklist)
+        # set up counters for depth logging
+        self.above = 0
+        self.below = 0
+        self.Nabove = 0
+        self.Nbelow = 0
+        self.masked = 0
+        self.offtarget = 0
+        # set up counters for SNP/del logging
+        self.ref = {'A':{'T':0,'C':0,'G':0}, 'T':{'A':0,'C':0,'G':0}, 'C':{'A':0,'T':0,'G':0}, 'G':{'A':0,'T':0,'C':0}}
+        self.indels = 0
+        self.SNPs = 0
+        # set up counters for appended noisefinder features
+        self.lowcov = 0
+        self.noisy = 0
+
+    def total(self):
+        return self.above + self.below + self.masked
+
+    def call(self, rows):
+        maxref = 1.0 - self.minfrq
+        targets = self.targets
+        bases = {'A':'TCG', 'T':'ACG', 'C':'ATG', 'G':'ATC'}
+        pat1 = re.compile('[atcgn]', re.I)
+        pat2 = re.compile('[+-]\d+')
+
+        # parse pileup rows
+        current = None
+        mask = False
+        for row in rows:
+            if row[0] != current:
+                current = row[0]
+                if current in self.blacklist:
+                    mask = True
+                    zones = self.blacklist[current]
+                else:
+                    mask = False
+                continue
+            t = self # tally on-target rows (or all rows if no targets) on this caller
+            if targets is not None and not targets.contains(row[0], row[1]): # contigs without targets are rejected before any conversion of the row
+                self.offtarget += 1
+                if self.off is None:
+                    continue
+                t = self.off
+            if int(row[3]) < self.mindep: # ignore rows if mindep below cutoff
+                t.below += 1
+                if row[2] == 'N':
+                    t.Nbelow += 1
+                continue
+            elif not pat1.search(row[4]): # ignore rows if no mismatch present
+                t.above += 1
+                if row[2] == 'N':
+                    t.Nabove += 1
+                continue
+            elif len(pat1.findall(row[4]))/int(row[3]) >= self.minfrq:
+                if mask == True and any(min <= int(row[1]) <= max for (min,max) in zones): # ignore rows if mask in ON and in zone that is blacklisted.
+                    t.masked += 1
+                    continue
+                t.above += 1
+                if row[2] == 'N':
+                    t.Nabove += 1
+                mmatches = ''.join(pat1.findall(row[4])).upper()
+                truPos = False
+                dep = int(row[3])
+                if not pat2.search(row[4]):
+                    for k in bases.keys():
+                        if row[2] == k:
+                            for b in bases[k]:
+                                freq = mmatches.count(b)/dep
+                                if freq >= self.minfrq:
+                                    if truPos == False:
+                                        t.SNPs += 1
+                                    truPos = True
+                                    t.ref[k][b] += 1
+                                    if t is self: # off-target calls are only tallied
+                                        yield (row[0], row[1], k + '>' + b, str(round(freq,3)))
+                                else:
+                                    continue
+                                if freq > maxref:
+                                    break
+                            break
+                else:
+                    InDel = pat2.findall(row[4])
+                    freq = len(InDel)/dep
+                    if freq >= self.idfrq:
+                        if t is self:
+                            yield (row[0], row[1], 'indel>' + ','.join(list(set(InDel))), str(round(freq,3)))
+                        t.indels += 1
+            else: # ignore rows if overall mismatch rate below cutoff
+                t.above += 1
+                if row[2] == 'N':
+                    t.Nabove += 1
+                continue
+
+    def noise_features(self, rows):
+        # converts noisefinder rows to records in adjusted format (<position> field contains start of low coverage or noisy alignment region)
+        for row in rows:
+            randVal = randint(0, 100, 1) # a random number is added to the start coord so that SNPtracker won't disregard noisy/lowcov features with identical starts in multiple mutants
+            try:
+                randStart = int(row[1]) + randVal[0]
+                if 'xxx' in row[4]:
+                    self.lowcov += 1
+                    yield (row[0], str(randStart), 'lowcov', 'NaN')
+                elif float(row[4]):
+                    self.noisy += 1
+                    yield (row[0], str(randStart), 'noisy', 'NaN')
+            except (IndexError, ValueError):
+                continue
+
+def print_tally(caller, prefix=''):
+    # prints SNP and indel tallies of a SNPcaller, labels prefixed with prefix (eg. for off-target tallies)
+    print(prefix + 'SNP positions detected: ' + str(caller.SNPs) + '\n<type>\t<occurences>\n')
+    for k in 'ATCG':
+        for i in caller.ref[k]:
+            print(k + '>' + i + ':\t' + str(caller.ref[k][i]))
+        if k != 'G':
+            print('')
+    print('\n' + prefix + 'indels' + ':\t' + str(caller.indels) + '\n')
+
+def depth_tally(caller, prefix=''):
+    # returns depth tallies of a SNPcaller as lines, labels prefixed with prefix
+    return prefix + 'bp total=' + str(caller.total()) + '\n' + prefix + 'bp above=' + str(caller.above) + ' (' + str(caller.Nabove) + ' Ns)' + '\n' + prefix + 'bp below=' + str(caller.below) + ' (' + str(caller.Nbelow) + ' Ns)' + '\n' + prefix + 'SNPs masked=' + str(caller.masked) + '\n'
+
 def main():
 
     # Parse arguments.
@@ -20,156 +172,53 @@ def main():
     parser.add_argument('-x', '--idfrq', help='set min frequency of indel to report an indel (default=0.8)', default=0.8, type=float, required=False)
     parser.add_argument('-b', '--blacklist', type=argparse.FileType('r'), help='provide a noisefinder outfile listing contig regions to omit from analysis.', required=False)
     parser.add_argument('-a', '--appendbl', help='indicate a noisefinder outfile to append its contents to SNPlogger out in adjusted format. Or indicate "True" to use same file as in -b/--blacklist (can be useful to include poor coverage/alignment zones in subsequent mutant analysis - <position> field contains start of low coverage or noisy alignment region).', required=False)
+    parser.add_argument('-t', '--targets', type=argparse.FileType('r'), help='provide a BED file of target regions (eg. exome capture baits). Only on-target positions are called and tallied, off-target positions are skipped unparsed. The same BED can be given to samtools mpileup -l to restrict the pileup upstream.', required=False)
+    parser.add_argument('-s', '--offstats', help='with -t/--targets, also parse off-target positions and report their depth and SNP tallies separately (off-target SNPs are not written to output)', action='store_true', required=False)
     args = parser.parse_args()
 
     # retrieve contigs from blacklist
+    ctgdict = None
     if args.blacklist:
-        ctgdict = {}
-        listIn = csv.reader(args.blacklist, delimiter = '\t')
-        for row in listIn:
-            try:
-                if row[0] in ctgdict:
-                    ctgdict.setdefault(row[0], []).append((int(row[1]),int(row[2])))
-                else:
-                    ctgdict[row[0]]=[(int(row[1]),int(row[2]))]
-            except (IndexError, ValueError):
-                continue
-        #generates something like: {'contig_1':[(210,510),(1215,3211)],'contig_2':[(123,456),(789,1112),...} 
+        listIn = list(csv.reader(args.blacklist, delimiter = '\t'))
+        ctgdict = load_blacklist(listIn)
         print(str(len(ctgdict.keys())) + ' contigs added to blacklist.\n')
-    
-    # set up counters for depth logging
-    above = 0
-    below = 0
-    Nabove = 0
-    Nbelow = 0
-    masked = 0
-
-    # set up counters for SNP/del logging
-    pileIn = csv.reader(args.input, delimiter = '\t', quoting=csv.QUOTE_NONE)
-    fileOut = open(args.output, 'w')
-    maxref = 1.0 - args.minfrq
-    A = {'T':0,'C':0,'G':0}
-    T = {'A':0,'C':0,'G':0}
-    C = {'A':0,'T':0,'G':0}
-    G = {'A':0,'T':0,'C':0}
-    ref = {'A':A, 'T':T, 'C':C, 'G':G}
-    bases = {'A':'TCG', 'T':'ACG', 'C':'ATG', 'G':'ATC'}
-    indels = 0
-    SNPs = 0
-    pat1 = re.compile('[atcgn]', re.I)
-    pat2 = re.compile('[+-]\d+')
+
+    # index target regions
+    targets = None
+    if args.targets:
+        targets = TargetIndex(csv.reader(args.targets, delimiter = '\t', quoting=csv.QUOTE_NONE))
+        print(str(len(targets)) + ' contigs with targets (' + str(targets.length()) + ' bp) indexed.\n')
 
     # open pileup and parse
-    current = None
-    mask = False
-    for row in pileIn:
-        if row[0] != current:
-            current = row[0]
-            if args.blacklist and current in ctgdict:
-                mask = True
-                zones = ctgdict[current]
-            else:
-                mask = False
-        elif int(row[3]) < args.mindep: # ignore rows if mindep below cutoff
-            below += 1
-            if row[2] == 'N':
-                Nbelow += 1
-            continue
-        elif not pat1.search(row[4]): # ignore rows if no mismatch present
-            above += 1
-            if row[2] == 'N':
-                Nabove += 1
-            continue
-        elif len(pat1.findall(row[4]))/int(row[3]) >= args.minfrq:
-            if mask == True and any(min <= int(row[1]) <= max for (min,max) in zones): # ignore rows if mask in ON and in zone that is blacklisted.
-                masked += 1
-                continue
-            above += 1
-            if row[2] == 'N':
-                Nabove += 1
-            mmatches = ''.join(pat1.findall(row[4])).upper()
-            truPos = False
-            dep = int(row[3])
-            if not pat2.search(row[4]):
-                for k in bases.keys():
-                    if row[2] == k:
-                        for b in bases[k]:
-                            freq = mmatches.count(b)/dep
-                            if freq >= args.minfrq:
-                                if truPos == False:
-                                    SNPs += 1
-                                truPos = True
-                                ref[k][b] += 1
-                                fileOut.write(row[0] + '\t' + row[1] + '\t' + k + '>' + b + '\t' + str(round(freq,3)) + '\n')
-                            else:
-                                continue
-                            if freq > maxref:
-                                break
-                        break
-            else:
-                InDel = pat2.findall(row[4])
-                freq = len(InDel)/dep
-                if freq >= args.idfrq:
-                    fileOut.write(row[0] + '\t' + row[1] + '\tindel>' + ','.join(list(set(InDel))) + '\t' + str(round(freq,3)) + '\n')
-                    indels += 1
-        else: # ignore rows if overall mismatch rate below cutoff
-            above += 1
-            if row[2] == 'N':
-                Nabove += 1
-            continue
+    caller = SNPcaller(args.mindep, args.minfrq, args.idfrq, ctgdict, targets, args.offstats)
+    pileIn = csv.reader(args.input, delimiter = '\t', quoting=csv.QUOTE_NONE)
+    fileOut = open(args.output, 'w')
+    for record in caller.call(pileIn):
+        fileOut.write('\t'.join(record) + '\n')
 
     # append contents of noisefinder if indicated by -b
     if args.appendbl:
-        lowcov = 0
-        noisy = 0
         if args.appendbl in ['T', 't', 'True', 'true', 'TRUE']:
-            args.blacklist.seek(0)
-            for row in listIn:
-                randVal = randint(0, 100, 1) # a random number is added to the start coord so that SNPtracker won't disregard noisy/lowcov features with identical starts in multiple mutants
-                try:
-                    randStart = int(row[1]) + randVal[0]
-                    if 'xxx' in row[4]:
-                        lowcov += 1
-                        fileOut.write(row[0] + '\t' + str(randStart) + '\tlowcov\tNaN\n')
-                    elif float(row[4]):
-                        noisy += 1
-                        fileOut.write(row[0] + '\t' + str(randStart) + '\tnoisy\tNaN\n')
-                except (IndexError, ValueError):
-                    continue
+            appendOut = listIn
         else:
-            appendIn = open(args.appendbl, 'rU')
+            appendIn = open(args.appendbl, 'r')
             appendOut = csv.reader(appendIn, delimiter = '\t')
-            for row in appendOut:
-                randVal = randint(0, 100, 1)
-                try:
-                    randStart = int(row[1]) + randVal[0]
-                    if 'xxx' in row[4]:
-                        lowcov += 1
-                        fileOut.write(row[0] + '\t' + str(randStart) + '\tlowcov\tNaN\n')
-                    elif float(row[4]):
-                        noisy += 1
-                        fileOut.write(row[0] + '\t' + str(randStart) + '\tnoisy\tNaN\n')
-                except (IndexError, ValueError):
-                    continue
+        for record in caller.noise_features(appendOut):
+            fileOut.write('\t'.join(record) + '\n')
     fileOut.close()
 
-    total = above + below + masked
-    print('SNP positions detected: ' + str(SNPs) + '\n<type>\t<occurences>\n')
-    for i in A:
-        print('A>' + i + ':\t' + str(A[i]))
-    print('')
-    for i in T:
-        print('T>' + i + ':\t' + str(T[i]))
-    print('')
-    for i in C:
-        print('C>' + i + ':\t' + str(C[i]))
-    print('')
-    for i in G:
-        print('G>' + i + ':\t' + str(G[i]))
-    print('\nindels' + ':\t' + str(indels) + '\n')
+    print_tally(caller)
     if args.appendbl:
-        print('appended ' + str(lowcov) + ' low coverage regions and '+ str(noisy) + ' noisy alignment regions to output.\n')
-    print(str(args.input) + '\ndepth cutoff: ' + str(args.mindep) + '\nbp total=' + str(total) + '\nbp above=' + str(above) + ' (' + str(Nabove) + ' Ns)' + '\nbp below=' + str(below) + ' (' + str(Nbelow) + ' Ns)' + '\nSNPs masked=' + str(masked) + '\n')
+        print('appended ' + str(caller.lowcov) + ' low coverage regions and '+ str(caller.noisy) + ' noisy alignment regions to output.\n')
+    print(str(args.input) + '\ndepth cutoff: ' + str(args.mindep) + '\n' + depth_tally(caller))
+    if targets is not None:
+        print('targets: ' + args.targets.name + ' (tallies above are on-target only)\nbp off-target=' + str(caller.offtarget))
+        if caller.off is not None:
+            print('')
+            print_tally(caller.off, 'off-target ')
+            print(depth_tally(caller.off, 'off-target '))
+        else:
+            print('off-target positions not analysed (use -s/--offstats).\n')
 
 if __name__ == '__main__':
     main()
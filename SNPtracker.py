@@ -10,10 +10,271 @@
 # each of the reduced mutant lists then has the coordinate suffix stripped from it so only the seqID remains
 # each combination of all possible subset of mutant sets are generated
 # for each combination subset of mutant sets, the intersection is found and written to a summary report as well as a detailed report if option given
+# if contig lengths are given (.fai), each discovery is scored by the probability of that many mutants hitting the contig by chance and sorted by it
 
 import argparse, sys, csv, math, re, itertools
+from collections import namedtuple
+import numpy as np
 csv.field_size_limit(sys.maxsize)
 
+# a discovery on a sequence ID (or region thereof if proximal) shared by a subset of mutants
+# details pairs mutant names with their features on that sequence/region, as written to verbose reports
+# pvalue is the chance of as many mutants hitting the sequence/region (None if not scored, NaN if its length is unknown)
+Candidate = namedtuple('Candidate', ['label', 'seq', 'details', 'pvalue'])
+
+def rank(candidate):
+    # sort key of candidates, lowest pvalue first and unknown last
+    if candidate.pvalue is None or math.isnan(candidate.pvalue):
+        return float('inf')
+    return candidate.pvalue
+
+def read_log(path):
+    # yields rows of a SNPlogger generated file
+    with open(path, 'r') as temp:
+        for row in csv.reader(temp, delimiter = '\t', quoting=csv.QUOTE_NONE):
+            yield row
+
+def read_fai(path):
+    # returns dict pairing seq IDs with their lengths from a samtools faidx index
+    lengths = {}
+    with open(path, 'r') as temp:
+        for row in csv.reader(temp, delimiter = '\t', quoting=csv.QUOTE_NONE):
+            try:
+                lengths[row[0]] = int(row[1])
+            except (IndexError, ValueError):
+                continue
+    return lengths
+
+def read_stats(path):
+    # returns bp analysed (bp above depth cutoff) from a file of SNPlogger STDOUT, or None if not found
+    with open(path, 'r') as temp:
+        for line in temp:
+            found = re.match(r'bp above=(\d+)', line)
+            if found:
+                return int(found.group(1))
+    return None
+
+def compile_select(select):
+    # compiles list of polymorphism types to a single pattern. "any" matches any N>N
+    select = [s for s in select if s != 'any'] + (['\\w>\\w'] if 'any' in select else [])
+    return re.compile('(' + ')|('.join(select) + ')')
+
+def load_wildtype(logs):
+    # union of features (concat seqID and coordinate) across any number of wildtype logs, each an iterable of rows
+    wSet = set([])
+    for log in logs:
+        for row in log:
+            wSet.add(row[0] + ' ' + row[1])
+    return wSet
+
+def load_features(rows, features=None, minfrq=None, keepRaw=False):
+    # reads one mutant's features (concat seqID and coordinate) from an iterable of rows, keeping those that satisfy features (compiled pattern) and/or minfrq
+    # returns (set of kept features, set of features masked by selection/filtering, list of kept rows). The last two are only populated if keepRaw
+    mSet = set([])
+    mMask = set([])
+    mRows = []
+    for row in rows:
+        if features and minfrq:
+            keep = re.match(features, row[2]) and (float(row[3]) >= minfrq or math.isnan(float(row[3])))
+        elif features or minfrq:
+            keep = (minfrq and (float(row[3]) >= minfrq or math.isnan(float(row[3])))) or (features and re.match(features, row[2]))
+        else:
+            keep = True
+        if keep:
+            mSet.add(row[0] + ' ' + row[1])
+            if keepRaw:
+                mRows.append(row)
+        elif keepRaw:
+            mMask.add(row[0] + ' ' + row[1])
+    return mSet, mMask, mRows
+
+class CandidateScorer(object):
+    # precomputes, for every contig at once, the probability of at least n mutants hitting it by chance (n = 0..number of mutants)
+    # each mutant hits a contig of length L with probability 1-exp(-rate*L), where rate is its features per bp analysed
+    # if window is given (proximal), probabilities are first computed for one window and then for any of the L/window windows on the contig
+    # the number of mutants hitting a contig is then Poisson-binomial, its distribution is built up one mutant at a time over all contigs
+
+    def __init__(self, lengths, rates, window=None):
+        self.pos = dict((seq, i) for (i, seq) in enumerate(lengths)) # seq IDs paired with their row in self.tail
+        L = np.array(list(lengths.values()), dtype=float)
+        wL = np.minimum(L, window) if window else L
+        hit = 1.0 - np.exp(-np.outer(wL, np.array(rates, dtype=float))) # contigs x mutants
+        dist = np.zeros((len(L), len(rates)+1))
+        dist[:,0] = 1.0
+        for j in range(len(rates)):
+            p = hit[:,j:j+1]
+            dist[:,1:] = dist[:,1:]*(1.0-p) + dist[:,:-1]*p
+            dist[:,0] *= 1.0 - p[:,0]
+        self.tail = np.cumsum(dist[:,::-1], axis=1)[:,::-1] # tail[:,n] = P(at least n mutants)
+        if window: # P(any window on the contig has at least n mutants) = 1-(1-p)**windows
+            windows = np.maximum(L/window, 1.0)[:,None]
+            with np.errstate(divide='ignore'): # log1p(-1) = -inf gives p = 1 as it should
+                self.tail = -np.expm1(windows * np.log1p(-np.minimum(self.tail, 1.0)))
+
+    def pvalue(self, seq, n):
+        if seq not in self.pos:
+            return float('nan')
+        return float(self.tail[self.pos[seq], n])
+
+    def minimum(self, n):
+        # lowest pvalue any contig can reach with n mutants
+        if len(self.pos) == 0:
+            return float('nan')
+        return float(self.tail[:,n].min())
+
+class CandidateFinder(object):
+    # finds sequence IDs/regions with coinciding polymorphic features across mutants
+    # mutants is a list of (name, rows) pairs and wildtypes a list of rows, where rows are any iterable of SNPlogger records (eg. read_log() or SNPlogger.SNPcaller.call())
+
+    def __init__(self, mutants, wildtypes=None, features=None, minfrq=None, proximal=None, tolerate=1, verbose=False):
+        self.proximal = proximal
+        self.verbose = verbose
+        self.mVarD = {} # mutant var names paired with original name
+        self.shared = {} # mutant var names paired with number of features shared with wildtype(s)
+        self.mSetD = {} # mutant var names paired with redundancy removed set of their seq IDs
+        self.mRawD = {} # mutant var names paired with nested dict that pairs contig id with list of tuples containing all features
+        self.counts = {} # mutant var names paired with number of features retained after masking
+        self.scorer = None # CandidateScorer, set by score()
+        self.unscored = set([]) # seq IDs with features but no length given to score(), their candidates get NaN pvalues
+        self.stopped = None # subset number of mutants at which find() stopped early because no contig could reach maxp
+        keepRaw = verbose or bool(proximal)
+        mRedD = {} # mutant var names paired with redundant set of their concat features and position
+        mMask = {} # mutant var names paired with set of concat features and positions to mask based on features|minfrq
+        mRows = {} # mutant var names paired with rows kept after selection/filtering
+
+        wSet = load_wildtype(wildtypes) if wildtypes else set([])
+        for i in range(len(mutants)):
+            mVar = 'm'+str(i)
+            self.mVarD[mVar] = mutants[i][0]
+            mSet, mMask[mVar], mRows[mVar] = load_features(mutants[i][1], features, minfrq, keepRaw)
+            if wildtypes:
+                rSet = mSet - wSet
+                self.shared[mVar] = len(mSet) - len(rSet)
+                mSet = rSet
+            mRedD[mVar] = mSet
+
+        # iterate over subset combos from N(mutants) to tolerate to remove identical SNPs
+        rGlobal = set([]) # set of globally redundant positions
+        for n in range(len(self.mVarD), tolerate, -1):
+            for s in itertools.combinations(self.mVarD.keys(), n):
+                rGlobal.update(set.intersection(*[mRedD[var] for var in s])) # intersection of mutant subset (identical/redundant positions across n mutants)
+        for mVar in self.mVarD:
+            rmdup = mRedD[mVar] - rGlobal # remove any globally redundant positions from each mutant
+            self.counts[mVar] = len(rmdup)
+            self.mSetD[mVar] = set([re.sub('\s\d+$','',x) for x in list(rmdup)]) # removes space and coordinate leaving only seq IDs in set
+            if keepRaw:
+                self.mRawD[mVar] = dict((k, []) for k in self.mSetD[mVar])
+                maskTotal = wSet | mMask[mVar] | rGlobal
+                for row in mRows[mVar]:
+                    if row[0] in self.mRawD[mVar] and ' '.join([row[0],row[1]]) not in maskTotal:
+                        self.mRawD[mVar][row[0]].append(tuple(row[1:]))
+
+    def score(self, lengths, analysed=None):
+        # enables scoring of candidates given contig lengths and, optionally, list of bp analysed per mutant (in mutant order, default total of lengths for all mutants)
+        total = sum(lengths.values())
+        rates = []
+        for i, mVar in enumerate(self.mVarD):
+            bp = analysed[i] if analysed else total
+            rates.append(self.counts[mVar]/bp if bp else 0.0)
+        self.scorer = CandidateScorer(lengths, rates, self.proximal)
+        self.unscored = set([seq for mSet in self.mSetD.values() for seq in mSet if seq not in lengths])
+
+    def _pvalue(self, seq, n):
+        if self.scorer is None:
+            return None
+        return self.scorer.pvalue(seq, n)
+
+    def _candidate(self, label, seq, s):
+        details = [(self.mVarD[var], self.mRawD[var][seq]) for var in s if seq in self.mRawD.get(var, {})]
+        return Candidate(label, seq, details, self._pvalue(seq, len(s)))
+
+    def _proximal(self, seq, s, nInt):
+        # within contig testing. Returns candidate regions where features of all mutants in s reside within window
+        coords = {}
+        allVals = []
+        for var in s: # retrieve coords from mRawD[var], setup sliding window loop testing each time below
+            coords[var] = [int(feature[0]) for feature in self.mRawD[var][seq]]
+            allVals = allVals + coords[var]
+        maxVal = max(allVals)
+        lowLim = min(allVals)
+        if (maxVal - lowLim) <= self.proximal: # report all mutant features if min to max range is lower than given proximal range
+            return [self._candidate(seq + ':' + str(lowLim) + '-' + str(maxVal), seq, s)]
+        tile = self.proximal//4 # sets an arbitrary tile size of 1/4 the given window size to increment by
+        uppLim = lowLim + self.proximal
+        zones = set([])
+        while lowLim < (maxVal - tile): # within window testing of coords for each mutant: if at least nInt independent features (tally == nInt) given that any(coords per var fall within window), post the coords of lower feature and upper feature in that window to zones (zone set object in case duplicates due to tiling)
+            tally = 0
+            inWindow = []
+            for var in coords:
+                varHits = [coord for coord in coords[var] if lowLim <= coord <= uppLim]
+                if len(varHits) > 0:
+                    tally += 1
+                    inWindow = inWindow + varHits
+            if tally == nInt:
+                zones.add((min(inWindow),max(inWindow)))
+            lowLim += tile
+            uppLim += tile
+        candidates = []
+        for zone in zones:
+            details = []
+            for var in s:
+                for feature in self.mRawD[var][seq]:
+                    if zone[0] <= int(feature[0]) <= zone[1]:
+                        details.append((self.mVarD[var], [feature]))
+            candidates.append(Candidate(seq + ':' + str(zone[0]) + '-' + str(zone[1]), seq, details, self._pvalue(seq, nInt))) # label in form eg. "contig_888:1500-3500"
+        return candidates
+
+    def _level(self, nInt, sGlobal, maxp=None):
+        # returns hits for one subset number of mutants, as a list of (candidates, mutant names) pairs, one per line of the summary report
+        # if scored, each line holds a single candidate, lines are sorted by pvalue and candidates with pvalue > maxp are dropped (unscored candidates are kept, last)
+        hits = []
+        for s in itertools.combinations(self.mSetD.keys(), nInt): # iterate over combinations of n mutants
+            mNames = [self.mVarD[var] for var in s]
+            sInter = set.intersection(*[self.mSetD[var] for var in s]) - sGlobal # diff of intersection of mutant subset minus contigs already found (prevent duplication if promixmal off)
+            if self.proximal:
+                for seq in sInter:
+                    candidates = self._proximal(seq, s, nInt)
+                    if len(candidates) != 0:
+                        hits.append((candidates, mNames))
+            elif len(sInter) != 0:
+                sGlobal.update(sInter)
+                hits.append(([self._candidate(seq, seq, s) for seq in sInter], mNames))
+        if self.scorer is not None:
+            hits = [([c], mNames) for (candidates, mNames) in hits for c in candidates if maxp is None or not c.pvalue > maxp] # NaN pvalues are kept
+            hits.sort(key=lambda hit: rank(hit[0][0]))
+        return hits
+
+    def find(self, minN=2):
+        # yields (n, hits) for each subset number of mutants from all mutants down to minN (see _level)
+        sGlobal = set([]) # set of all contigs already found
+        for nInt in range(len(self.mSetD), minN-1, -1): # iterate over n mutants
+            yield nInt, self._level(nInt, sGlobal)
+
+    def ranked(self, minN=2, maxp=None, maxk=None):
+        # returns (n, candidate, mutant names) for subset numbers of mutants from all mutants down to minN, sorted by pvalue across all of them (needs score())
+        # only candidates with pvalue <= maxp (unscored are kept, last) and at most maxk are returned. As pvalues only rise with fewer mutants, the search stops
+        # once no contig can reach maxp, or beat the maxk-th best pvalue found so far, with fewer mutants. self.stopped and self.stopcause then record where and why
+        sGlobal = set([]) # set of all contigs already found
+        self.stopped = None
+        self.stopcause = None
+        self.truncated = False # True if more than maxk candidates were found
+        best = []
+        for nInt in range(len(self.mSetD), minN-1, -1): # iterate over n mutants
+            lowest = self.scorer.minimum(nInt)
+            if maxp is not None and not self.unscored and not lowest <= maxp: # not possible if unscored candidates may follow
+                self.stopped, self.stopcause = nInt, 'pvalue'
+                break
+            if maxk and len(best) >= maxk and lowest >= rank(best[maxk-1][1]):
+                self.stopped, self.stopcause = nInt, 'max-candidates'
+                break
+            for candidates, mNames in self._level(nInt, sGlobal, maxp):
+                best.extend([(nInt, c, mNames) for c in candidates])
+            best.sort(key=lambda hit: rank(hit[1])) # stable, so ties keep candidates with more mutants first
+            if maxk and len(best) > maxk:
+                del best[maxk:]
+                self.truncated = True
+        return best
+
 def main():
 
     # Parse arguments.
@@ -27,23 +288,16 @@ def main():
     parser.add_argument('-p', '--proximal', help='indicate window size. Instead of finding features that coincide on a particular contig, SNPtracker will find features that reside close to each other within a user defined window size (min=1000 bases). Suitable for large scaffolds or pseudomolecules', type=int, required=False)
     parser.add_argument('-n', '--min', help='set min number of mutants to consider. Otherwise all mutant subsets >=2 are analysed', type=int, required=False, default=2)
     parser.add_argument('-t', '--tolerate', help='set max number of mutants to tolerate with polymorphisms in identical positions for a given discovery (default none)', type=int, required=False, default=1)
+    parser.add_argument('-r', '--fai', help='indicate reference .fai (samtools faidx) to score each discovery by the probability of that many mutants hitting the contig (or --proximal window) by chance, given its length and the mutation rate of each mutant. Discoveries are then sorted by this pvalue', required=False)
+    parser.add_argument('-k', '--stats', help='indicate space sep list of SNPlogger STDOUT files, in same order as --mutant, to take bp analysed per mutant for mutation rates (default uses total length in --fai)', nargs='*', required=False)
+    parser.add_argument('-q', '--pvalue', help='with --fai, only report discoveries with pvalue equal to or below this. Stops once no contig can reach it with fewer mutants', type=float, required=False)
+    parser.add_argument('-x', '--max-candidates', help='stop after reporting this many discoveries: the lowest pvalues across all numbers of mutants if --fai given, otherwise highest numbers of mutants first', type=int, required=False)
     args = parser.parse_args()
 
     if len(args.mutant) < 2:
         sys.exit("--mutant needs at least 2 arguments!")
 
-    mVarD = {} # mutant var names paired with original filename
-    mRedD = {} # mutant var names paired with redundant set of their concat features and position
-    mSetD = {} # mutant var names paired with redundancy removed set of their concat features and position
-    mRawD = {} # mutant var names paired with nested dict that pairs contig id with list of tuples containing all features
-    mSubD = {} # subsets (N>=2) paired with the combos of mutants sub(N)
-    mMask = {} # mutant var names paired with set of concat features and positions to mask based on args.filter|select
-
-    if args.select:
-        if 'any' in args.select:
-            args.select.remove('any')
-            args.select.append('\\w>\\w')
-        features = re.compile('(' + ')|('.join(args.select) + ')')
+    features = compile_select(args.select) if args.select else None
 
     if args.verbose in ['T', 't', 'True', 'true', 'TRUE']:
         verbose = True
@@ -54,103 +308,40 @@ def main():
         if args.proximal < 1000: # window size set to its allowed minumum if below that
             print('--proximal window size too small. Setting to 1000!')
             args.proximal = 1000
-        tile = args.proximal//4 # sets an arbitrary tile size of 1/4 the given window size to increment by
+
+    if args.pvalue is not None and not args.fai:
+        sys.exit("--pvalue needs --fai!")
+
+    if args.stats and not args.fai:
+        sys.exit("--stats needs --fai!")
+
+    if args.stats and len(args.stats) != len(args.mutant):
+        sys.exit("--stats needs one file per --mutant!")
+
+    if args.max_candidates is not None and args.max_candidates < 1:
+        sys.exit("--max-candidates needs to be at least 1!")
 
     if args.tolerate < 1 or args.tolerate > len(args.mutant):
         print('cannot use number given for --tolerate. Setting to default!')
         args.tolerate = 1
 
-    wSet = set([])
+    wLogs = [read_log(path) for path in args.wildtype] if args.wildtype else None
+    mLogs = [(path, read_log(path)) for path in args.mutant]
+    finder = CandidateFinder(mLogs, wLogs, features, args.filter, args.proximal, args.tolerate, verbose)
     if args.wildtype:
-        if len(args.wildtype) > 1:
-            for i in range(len(args.wildtype)):
-                temp = open(args.wildtype[i], 'r')
-                wLog = csv.reader(temp, delimiter = '\t', quoting=csv.QUOTE_NONE)
-                for row in wLog:
-                    wSet.add(row[0] + ' ' + row[1])
-            temp.close()
-        elif len(args.wildtype) == 1:
-            temp = open(args.wildtype[0], 'r')
-            wLog = csv.reader(temp, delimiter = '\t', quoting=csv.QUOTE_NONE)
-            for row in wLog:
-                wSet.add(row[0] + ' ' + row[1])
-            temp.close()
-
-    for i in range(len(args.mutant)): # iterate over mutant files
-        mVar = 'm'+str(i)
-        mVarD[mVar] = args.mutant[i]
-        mSet = set([])
-        mMask[mVar] = set([]) # used only if verbose combined with filter or select
-        with open(args.mutant[i], 'r') as temp:
-            mLog = csv.reader(temp, delimiter = '\t', quoting=csv.QUOTE_NONE)
-            if args.select and args.filter:
-                for row in mLog:
-                    if re.match(features, row[2]) and (float(row[3]) >= args.filter or math.isnan(float(row[3]))):
-                        mSet.add(row[0] + ' ' + row[1])
-                    elif verbose == True or args.proximal:
-                        mMask[mVar].add(row[0] + ' ' + row[1])
-            elif args.select or args.filter:
-                for row in mLog:
-                    keep = False
-                    if args.filter and (float(row[3]) >= args.filter or math.isnan(float(row[3]))):
-                        keep = True
-                    elif args.select and re.match(features, row[2]):
-                        keep = True
-                    if keep == True:
-                        mSet.add(row[0] + ' ' + row[1])
-                    elif verbose == True or args.proximal:
-                        mMask[mVar].add(row[0] + ' ' + row[1])
-            else:
-                for row in mLog:
-                    mSet.add(row[0] + ' ' + row[1])
-            if args.wildtype:
-                rSet = mSet - wSet
-                print(str(len(mSet) - len(rSet)) + ' features shared with wildype(s) masked from ' + mVarD[mVar] + ' after selection/filtering.')
-                del(mSet)
-                mRedD[mVar] = rSet
-                del(rSet)
-            else:
-                mRedD[mVar] = mSet
-                del(mSet)
-
-    # iterate over subset combos from N(mutants) to --tolerate to remove identical SNPs
-    mNums = []
-    for n in range(args.tolerate+1,len(mVarD)+1):
-        mSub = 'N'+str(n)
-        mNums.append(mSub)
-        mSubD[mSub] = []
-        for subset in itertools.combinations(mVarD.keys(), n):
-            mSubD[mSub].append(subset)
-    mNums = mNums[::-1]
-    rGlobal = set([]) # set of globally redundant positions found during runtime
-    for n in mNums: # iterate over n mutants
-        if args.tolerate == len(args.mutant):
-            break
-        for s in mSubD[n]: # iterate over combinations of n mutants
-            rTemp = []
-            for var in s:
-                rTemp.append(mRedD[var])
-            rInter = set.intersection(*rTemp) # intersection of mutant subset (identical/redundant positions across n mutants)
-            rGlobal.update(rInter)
-    for mVar in mVarD:
-        rmdup = mRedD[mVar] - rGlobal # remove any globally redundant positions from each mutant
-        mSetD[mVar] = set([re.sub('\s\d+$','',x) for x in list(rmdup)]) # removes space and coordinate leaving only seq IDs in set
-        if verbose == True or args.proximal:
-            mRawD[mVar] = dict.fromkeys(mSetD[mVar], None)
-            for k in mRawD[mVar].keys():
-                mRawD[mVar][k]=[]
-            temp = open(mVarD[mVar], 'r')
-            mLog = csv.reader(temp, delimiter = '\t', quoting=csv.QUOTE_NONE)
-            maskTotal = wSet | mMask[mVar] | rGlobal
-            for row in mLog:
-                if row[0] in mRawD[mVar] and ' '.join([row[0],row[1]]) not in maskTotal:
-                    mRawD[mVar][row[0]].append(tuple(row[1:]))
-            temp.close()
-
-    del(wSet)
-    del(mMask)
-    del(mRedD)
-    
+        for mVar in finder.mVarD:
+            print(str(finder.shared[mVar]) + ' features shared with wildype(s) masked from ' + finder.mVarD[mVar] + ' after selection/filtering.')
+    if args.fai:
+        analysed = None
+        if args.stats:
+            analysed = [read_stats(path) for path in args.stats]
+            for i in range(len(analysed)):
+                if analysed[i] is None:
+                    sys.exit("no 'bp above=' tally found in --stats file " + args.stats[i] + "!")
+        finder.score(read_fai(args.fai), analysed)
+        if finder.unscored:
+            print(str(len(finder.unscored)) + ' contigs with features not found in ' + args.fai + ' could not be scored (reported last with p=nan). Check --fai is from the same assembly.')
+
     nameOut = str(args.output) + '_summary.html'
     summaryOut = open(nameOut, 'w+')
     summaryOut.write('<!DOCTYPE html>\n<html>\n<h1>summary</h1>\n<h3>parameters</h3>\n')
@@ -160,9 +351,6 @@ def main():
         summaryOut.write('<p>\nwildtypes: NA')
     summaryOut.write('<br>\nmutants: ' + ', '.join(args.mutant))
     if args.select:
-        if '\\w>\\w' in args.select:
-            args.select.remove('\\w>\\w')
-            args.select.append('any')
         summaryOut.write('<br>\nselected: ' + ', '.join(args.select))
     else:
         summaryOut.write('<br>\nselected: NA')
@@ -178,108 +366,72 @@ def main():
         summaryOut.write('<br>\ntolerate: ' + str(args.tolerate) + '\n</p>\n')
     else:
         summaryOut.write('<br>\ntolerate: none\n</p>\n')
+    if args.fai:
+        summaryOut.write('<p>\nscored: ' + args.fai + (', bp analysed from: ' + ', '.join(args.stats) if args.stats else '') + '<br>\nmax pvalue: ' + str(args.pvalue if args.pvalue is not None else 'NA'))
+        summaryOut.write('<br>\nmax candidates: ' + str(args.max_candidates if args.max_candidates else 'NA') + '\n</p>\n')
+    elif args.max_candidates:
+        summaryOut.write('<p>\nmax candidates: ' + str(args.max_candidates) + '\n</p>\n')
 
-    del(mNums[:])
-    mSubD.clear()
-    for n in range(args.min,len(mSetD)+1):
-        mSub = 'N'+str(n)
-        mNums.append(mSub)
-        mSubD[mSub] = []
-        for subset in itertools.combinations(mSetD.keys(), n):
-            mSubD[mSub].append(subset)
-    mNums = mNums[::-1]
-    sGlobal = set([]) # set of all contigs already found during runtime
-    for n in mNums: # iterate over n mutants
-        nHits = 0
-        nInt = int(n.strip('N'))
-        summaryOut.write('\n<h3>polymorphic in ' + str(nInt) + ' mutants</h3>\n<p>\n')
-        if verbose == True: # open report file to write to if verbose true
-            vnameOut = str(args.output) + '_' + n + '_report.html'
-            verboseOut = open(vnameOut, 'w+')
-            verboseOut.write('<!DOCTYPE html>\n<html>\n<body>\n<h1>polymorphic in ' + str(nInt) + ' mutants</h1>\n')
-        for s in mSubD[n]: # iterate over combinations of n mutants
-            sTemp = []
-            mNames = [mVarD[var] for var in s]
-            for var in s:
-                sTemp.append(mSetD[var])
-            sInter = set.intersection(*sTemp) - sGlobal # diff of intersection of mutant subset minus contigs already found (prevent duplication if promixmal off)
-            if not args.proximal:
-                sGlobal.update(sInter)
-            if args.proximal and len(sInter) != 0:
-                for seq in sInter: # within contig testing
-                    coords = {}
-                    allVals = []
-                    for var in s: # retrieve coords from mRawD[var], setup sliding window loop testing each time below
-                        try:
-                            coords[var] = [int(feature[0]) for feature in mRawD[var][seq]]
-                        except BaseException as err:
-                            print(err.message)
-                            continue
-                    for coord in coords.values():
-                        allVals = allVals + coord
-                    maxVal = max(allVals)
-                    lowLim = min(allVals)
-                    if (maxVal - lowLim) <= args.proximal: # write out all mutant features if min to max range is lower than given proximal range
-                        nHits += 1
-                        summaryOut.write(seq + ':' + str(lowLim) + '-' + str(maxVal) + ' <----- (' + ', '.join(mNames) + ')<br>\n')
-                        if verbose == True:
-                            verboseOut.write('<h3>' + seq + ':' + str(lowLim) + '-' + str(maxVal) + '</h3>\n<p>\n')
-                            for var in s:
-                                if seq in mRawD[var]:
-                                    verboseOut.write(mVarD[var] + ' ' + str(mRawD[var][seq]).replace('\'','') + '<br>\n')
-                            verboseOut.write('</p>\n')
-                        continue
-                    uppLim = lowLim + args.proximal
-                    zones = set([])
-                    while lowLim < (maxVal - tile): # within window testing of coords for each mutant: if at least nInt independent features (tally == nInt) given that any(coords per var fall within window), post the coords of lower feature and upper feature in that window to zones (zone set object in case duplicates due to tiling)
-                        tally = 0
-                        inWindow = []
-                        for var in coords:
-                            varHits = [coord for coord in coords[var] if lowLim <= coord <= uppLim]
-                            if len(varHits) > 0:
-                                tally += 1
-                                inWindow = inWindow + varHits
-                        if tally == nInt:
-                            zmin = min(inWindow)
-                            zmax = max(inWindow)
-                            zones.add((zmin,zmax))
-                        lowLim += tile
-                        uppLim += tile
-                    seqHits = []
-                    if len(zones) != 0:
-                        nHits += len(zones)
-                        for zone in zones:
-                            record = seq + ':' + str(zone[0]) + '-' + str(zone[1])
-                            seqHits.append(record) # in form eg. "contig_888:1500-3500, contig_888:7000-9000, contig_901:1-2000 (mut1.log, mut3.log, mut5.log)"
-                            if verbose == True:
-                                verboseOut.write('<h3>' + record + '</h3>\n<p>\n')
-                                for var in s:
-                                    try:
-                                        for feature in mRawD[var][seq]:
-                                            if zone[0] <= int(feature[0]) <= zone[1]:
-                                                verboseOut.write(mVarD[var] + ' [' + str(feature).replace('\'','') + ']<br>\n')
-                                    except BaseException as err:
-                                        print(err.message)
-                                        continue
-                                verboseOut.write('</p>\n')
-                        summaryOut.write(', '.join(seqHits) + ' <----- (' + ', '.join(mNames) + ')<br>\n')                
-            elif len(sInter) != 0:
-                nHits += len(sInter)
-                summaryOut.write(', '.join(sInter) + ' <----- (' + ', '.join(mNames) + ')<br>\n')
-                if verbose == True: # write to corresponding verbose file
-                    for seq in sInter:
-                        verboseOut.write('<h3>' + seq + '</h3>\n<p>\n')
-                        for var in s:
-                            if seq in mRawD[var]:
-                                verboseOut.write(mVarD[var] + ' ' + str(mRawD[var][seq]).replace('\'','') + '<br>\n')
-                        verboseOut.write('</p>\n')
-            else:
-                continue
+    def tag(c): # label with pvalue if scored
+        if c.pvalue is None:
+            return c.label
+        return c.label + ' (p=' + '%.3g' % c.pvalue + ')'
+
+    def write_verbose(nInt, candidates): # detailed report for a subset number of mutants
+        verboseOut = open(str(args.output) + '_N' + str(nInt) + '_report.html', 'w+')
+        verboseOut.write('<!DOCTYPE html>\n<html>\n<body>\n<h1>polymorphic in ' + str(nInt) + ' mutants</h1>\n')
+        for c in candidates:
+            verboseOut.write('<h3>' + tag(c) + '</h3>\n<p>\n')
+            for name, feats in c.details:
+                verboseOut.write(name + ' ' + str(feats).replace('\'','') + '<br>\n')
+            verboseOut.write('</p>\n')
+        verboseOut.write('</body>\n</html>\n')
+        verboseOut.close()
+
+    if finder.scorer is not None: # rank candidates by pvalue across all subset numbers of mutants
+        hits = finder.ranked(args.min, args.pvalue, args.max_candidates)
+        summaryOut.write('\n<h3>ranked by pvalue</h3>\n<p>\n')
+        for nInt, c, mNames in hits:
+            summaryOut.write(tag(c) + ' in ' + str(nInt) + ' mutants <----- (' + ', '.join(mNames) + ')<br>\n')
         summaryOut.write('</p>\n')
-        print('found across ' + str(nInt) + ' mutants: ' + str(nHits))
-        if verbose == True:
-            verboseOut.write('</body>\n</html>\n')
-            verboseOut.close()
+        for nInt in range(len(args.mutant), (finder.stopped if finder.stopped is not None else args.min-1), -1):
+            candidates = [c for (n, c, mNames) in hits if n == nInt]
+            print('found across ' + str(nInt) + ' mutants: ' + str(len(candidates)))
+            if verbose == True:
+                write_verbose(nInt, candidates)
+        if finder.truncated:
+            summaryOut.write('\n<p>\nkept the best ' + str(args.max_candidates) + ' candidates (max candidates).\n</p>\n')
+            print('kept the best ' + str(args.max_candidates) + ' candidates (--max-candidates).')
+        if finder.stopped is not None:
+            if finder.stopcause == 'pvalue':
+                notice = 'no contig can reach pvalue ' + str(args.pvalue)
+            else:
+                notice = 'no contig can beat the kept max candidates'
+            summaryOut.write('\n<p>\n' + notice + ' with ' + str(finder.stopped) + ' or fewer mutants, remaining subsets not analysed.\n</p>\n')
+            print(notice + ' with ' + str(finder.stopped) + ' or fewer mutants, remaining subsets not analysed.')
+    else:
+        written = 0
+        for nInt, hits in finder.find(args.min): # iterate over n mutants
+            nHits = 0
+            kept = []
+            summaryOut.write('\n<h3>polymorphic in ' + str(nInt) + ' mutants</h3>\n<p>\n')
+            for candidates, mNames in hits:
+                if args.max_candidates:
+                    candidates = candidates[:args.max_candidates - written]
+                    if len(candidates) == 0:
+                        break
+                nHits += len(candidates)
+                written += len(candidates)
+                kept.extend(candidates)
+                summaryOut.write(', '.join([tag(c) for c in candidates]) + ' <----- (' + ', '.join(mNames) + ')<br>\n')
+            summaryOut.write('</p>\n')
+            print('found across ' + str(nInt) + ' mutants: ' + str(nHits))
+            if verbose == True: # write to corresponding verbose file
+                write_verbose(nInt, kept)
+            if args.max_candidates and written >= args.max_candidates:
+                summaryOut.write('\n<p>\nreached max candidates (' + str(args.max_candidates) + '), remaining subsets not analysed.\n</p>\n')
+                print('reached --max-candidates, remaining subsets not analysed.')
+                break
     summaryOut.write('</body>\n</html>\n')
     print('done.')
 
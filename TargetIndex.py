@@ -0,0 +1,83 @@
+# Copyright (C) 2017 Timothy C. Hewitt - All Rights Reserved
+# You may use, distribute and modify this code under the terms of the GNU Public License version 3 (GPLv3)
+# You should have recieved a copy of the GPLv3 license with this file. If not, please visit https://github.com/TC-Hewitt/MuTrigo
+
+#!/usr/bin/env python
+
+from bisect import bisect_right
+import argparse, sys, csv
+csv.field_size_limit(sys.maxsize)
+
+class TargetIndex(object):
+    # per-contig index of target regions (eg. exome capture baits) from BED rows
+    # overlapping intervals are merged and kept as sorted 0-based half-open start and end lists so positions can be looked up by bisection
+
+    def __init__(self, rows):
+        ctgdict = {}
+        for row in rows: # header/track lines and malformed rows are ignored
+            try:
+                zone = (int(row[1]),int(row[2]))
+            except (IndexError, ValueError):
+                continue
+            ctgdict.setdefault(row[0], []).append(zone)
+        self.index = {} # generates something like: {'contig_1':([209,1214],[510,3211]),...}
+        for ctg in ctgdict:
+            starts = []
+            ends = []
+            for (start,end) in sorted(ctgdict[ctg]):
+                if ends and start <= ends[-1]:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self.index[ctg] = (starts, ends)
+
+    def __contains__(self, seqid):
+        return seqid in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def contains(self, seqid, pos):
+        # True if 1-based pos (int or pileup string) on seqid falls in a target. Contigs without targets are rejected before pos is converted
+        if seqid not in self.index:
+            return False
+        starts, ends = self.index[seqid]
+        pos = int(pos) - 1
+        i = bisect_right(starts, pos) - 1
+        return i >= 0 and pos < ends[i]
+
+    def length(self):
+        # total bp targeted
+        return sum(end - start for (starts, ends) in self.index.values() for (start, end) in zip(starts, ends))
+
+    def bed(self):
+        # yields merged targets as BED fields, eg. to pass to "samtools mpileup -l"
+        for ctg in self.index:
+            starts, ends = self.index[ctg]
+            for (start, end) in zip(starts, ends):
+                yield (ctg, str(start), str(end))
+
+    def regions(self):
+        # yields merged targets as 1-based region strings, one per region, eg. for per-region pysam fetch(region=...) calls or samtools runs (samtools -r takes a single region; use bed() with -l for all targets at once)
+        for (ctg, start, end) in self.bed():
+            yield ctg + ':' + str(int(start) + 1) + '-' + end
+
+def main():
+
+    # Parse arguments.
+    parser = argparse.ArgumentParser(description='TargetIndex merges overlapping target regions in a BED file and prints them to STDOUT, either as BED (for samtools mpileup -l) or as one region string per line (for per-region use, eg. pysam fetch). Compatible with STDIN.')
+    parser.add_argument('-i', '--input', nargs='?', type=argparse.FileType('r'), default=sys.stdin, help='indicate input.bed (leave out if using STDIN).')
+    parser.add_argument('-r', '--regions', help='print targets as <seqid>:<start>-<end> region strings (1based) instead of BED', action='store_true', required=False)
+    args = parser.parse_args()
+
+    targets = TargetIndex(csv.reader(args.input, delimiter = '\t', quoting=csv.QUOTE_NONE))
+    if args.regions:
+        for region in targets.regions():
+            print(region)
+    else:
+        for row in targets.bed():
+            print('\t'.join(row))
+
+if __name__ == '__main__':
+    main()